@@ -15,64 +15,67 @@ async def main():
         await client.connect()
         print("Connected!")
         
-        # List available tools
-        print("\nListing available tools:")
-        tools = await client.list_tools()
+        # List tools, list tasks and add a new task concurrently: the calls are
+        # independent, and the TaskGroup cancels the rest if one of them fails
+        # (asyncio.TaskGroup requires Python 3.11+)
+        print("\nListing tools and tasks, adding a new task...")
+        async with asyncio.TaskGroup() as tg:
+            t_tools = tg.create_task(client.list_tools())
+            t_tasks = tg.create_task(client.call_tool("list_tasks"))
+            t_new_task = tg.create_task(client.call_tool(
+                "add_task", 
+                {"task_name": "Example task from client", "when": "today"}
+            ))
+        tools, list_result, new_task_result = t_tools.result(), t_tasks.result(), t_new_task.result()
+        
+        print("\nAvailable tools:")
         for tool in tools:
             print(f"- {tool['name']}: {tool['description']}")
         
-        # List all tasks
-        print("\nListing all tasks:")
-        result = await client.call_tool("list_tasks")
-        if "resources" in result and result["resources"]:
-            for task in result["resources"]:
+        print("\nAll tasks:")
+        if "resources" in list_result and list_result["resources"]:
+            for task in list_result["resources"]:
                 print(f"- {task['name']} ({task['id']})")
                 print(f"  {task['description']}")
         else:
             print("No tasks found.")
         
-        # Add a new task
-        print("\nAdding a new task:")
-        new_task_result = await client.call_tool(
-            "add_task", 
-            {"task_name": "Example task from client", "when": "today"}
-        )
         if "resources" in new_task_result and new_task_result["resources"]:
             new_task = new_task_result["resources"][0]
-            print(f"Added task: {new_task['name']} ({new_task['id']})")
+            print(f"\nAdded task: {new_task['name']} ({new_task['id']})")
             
-            # Complete the task
+            # Both updates write the same page; Notion may reject concurrent
+            # writes to one page, so they are sent one after another
             print("\nCompleting the task:")
             complete_result = await client.call_tool(
                 "complete_task", 
                 {"task_id": new_task["id"]}
             )
             if "resources" in complete_result and complete_result["resources"]:
-                completed_task = complete_result["resources"][0]
-                print(f"Task completed: {completed_task['name']}")
-                
-                # Uncomplete the task
-                print("\nUncompleting the task:")
-                uncomplete_result = await client.call_tool(
-                    "uncomplete_task", 
-                    {"task_id": new_task["id"]}
-                )
-                if "resources" in uncomplete_result and uncomplete_result["resources"]:
-                    uncompleted_task = uncomplete_result["resources"][0]
-                    print(f"Task uncompleted: {uncompleted_task['name']}")
-                    
-                    # Change task time
-                    print("\nChanging task time:")
-                    time_result = await client.call_tool(
-                        "set_task_time", 
-                        {"task_id": new_task["id"], "when": "later"}
-                    )
-                    if "resources" in time_result and time_result["resources"]:
-                        updated_task = time_result["resources"][0]
-                        print(f"Task time updated: {updated_task['name']}")
+                print(f"Task completed: {complete_result['resources'][0]['name']}")
+            
+            print("\nChanging the task time:")
+            time_result = await client.call_tool(
+                "set_task_time", 
+                {"task_id": new_task["id"], "when": "later"}
+            )
+            if "resources" in time_result and time_result["resources"]:
+                print(f"Task time updated: {time_result['resources'][0]['name']}")
+            
+            # Uncomplete the task
+            print("\nUncompleting the task:")
+            uncomplete_result = await client.call_tool(
+                "uncomplete_task", 
+                {"task_id": new_task["id"]}
+            )
+            if "resources" in uncomplete_result and uncomplete_result["resources"]:
+                uncompleted_task = uncomplete_result["resources"][0]
+                print(f"Task uncompleted: {uncompleted_task['name']}")
                     
-    except Exception as e:
-        print(f"Error: {e}")
+    except* Exception as eg:
+        # A TaskGroup failure arrives as an ExceptionGroup; print each real error
+        for e in eg.exceptions:
+            print(f"Error: {e}")
     finally:
         # Disconnect from the server
         await client.disconnect()
@@ -1,6 +1,5 @@
-import asyncio
 from . import server
 
 def main():
     """Main entry point for the package."""
-    asyncio.run(server.main())
\ No newline at end of file
+    server.run_server()
@@ -10,6 +10,7 @@ import os
 import json
 from datetime import datetime
 import httpx
+import orjson
 from typing import Any, Sequence
 from dotenv import load_dotenv
 from pathlib import Path
@@ -19,70 +20,249 @@ import argparse
 import asyncio
 from contextlib import asynccontextmanager
 from collections.abc import AsyncIterator
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+# .env file in the project root, loaded by setup_server()
+project_root = Path(__file__).parent.parent.parent
+env_path = project_root / '.env'
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('notion_mcp')
 
-# Find and load .env file from project root
-project_root = Path(__file__).parent.parent.parent
-env_path = project_root / '.env'
-if not env_path.exists():
-    raise FileNotFoundError(f"No .env file found at {env_path}")
-load_dotenv(env_path)
+def _configure_logging() -> None:
+    """Configure logging from LOG_LEVEL, falling back to WARNING for unknown levels."""
+    level_name = os.getenv("LOG_LEVEL", "WARNING").upper()
+    # getLevelName возвращает число только для известных уровней
+    level = logging.getLevelName(level_name)
+    if not isinstance(level, int):
+        logging.basicConfig(level=logging.WARNING)
+        logger.warning("Unknown LOG_LEVEL %r, using WARNING", level_name)
+        return
+    logging.basicConfig(level=level)
 
-# Configuration with validation
-NOTION_API_KEY = os.getenv("NOTION_API_KEY")
-if not NOTION_API_KEY:
-    raise ValueError("NOTION_API_KEY environment variable is required")
+# Optional comma-separated tool lists to limit what the server exposes, read by setup_server()
+ENABLED_TOOLS: set[str] = set()
+DISABLED_TOOLS: set[str] = set()
 
-NOTION_DATABASE_ID = os.getenv("NOTION_DATABASE_ID")
-if not NOTION_DATABASE_ID:
-    raise ValueError("NOTION_DATABASE_ID environment variable is required")
+def _tool_names(var: str) -> set[str]:
+    """Parse a comma-separated list of tool names from an environment variable."""
+    return {name.strip() for name in os.getenv(var, "").split(",") if name.strip()}
 
 NOTION_API_URL = "https://api.notion.com/v1"
 NOTION_VERSION = "2022-06-28"
 
-# Headers for Notion API requests
-HEADERS = {
-    "Authorization": f"Bearer {NOTION_API_KEY}",
-    "Content-Type": "application/json",
-    "Notion-Version": NOTION_VERSION,
-}
+@dataclass(frozen=True)
+class NotionConfig:
+    api_key: str
+    database_id: str
+    # Headers for Notion API requests
+    headers: dict[str, str]
+
+@lru_cache(maxsize=None)
+def _config() -> NotionConfig:
+    """Validate the Notion configuration once, on first use."""
+    api_key = os.getenv("NOTION_API_KEY")
+    if not api_key:
+        raise ValueError("NOTION_API_KEY environment variable is required")
+    
+    database_id = os.getenv("NOTION_DATABASE_ID")
+    if not database_id:
+        raise ValueError("NOTION_DATABASE_ID environment variable is required")
+    
+    return NotionConfig(
+        api_key=api_key,
+        database_id=database_id,
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Notion-Version": NOTION_VERSION,
+        },
+    )
+
+# Cache settings for Notion API reads
+QUERY_CACHE_TTL = 60.0
+QUERY_CACHE_MAXSIZE = 128
+SCHEMA_CACHE_TTL = 600.0
 
 # Определение класса для контекста приложения
 @dataclass
 class NotionContext:
     client: httpx.AsyncClient
+    # Кэш ответов на запросы: ключ -> (время загрузки, ответ Notion)
+    query_cache: dict[bytes, tuple[float, dict]] = field(default_factory=dict)
+    schema_cache: tuple[float, dict] | None = None
+    # Последние версии измененных задач: id -> (время изменения, страница)
+    task_cache: dict[str, tuple[float, dict]] = field(default_factory=dict)
+    # Фоновые обновления кэша, по одному на ключ
+    refreshing: dict[bytes, asyncio.Task] = field(default_factory=dict)
+    # Увеличивается при каждой инвалидации, чтобы устаревшие ответы не попадали в кэш
+    generation: int = 0
+
+    def invalidate(self) -> None:
+        """Drop cached query results after the database was modified."""
+        self.generation += 1
+        self.query_cache.clear()
+        self.task_cache.clear()
+
+    def drop_filtered_queries(self) -> None:
+        """Drop cached filtered queries after a task was updated.
+        
+        An update can move a task into or out of a filter, which the
+        task_cache overlay cannot express.
+        """
+        # Ответы, отправленные до изменения, тоже не должны попасть в кэш
+        self.generation += 1
+        for key in [k for k in self.query_cache if "filter" in orjson.loads(k)]:
+            del self.query_cache[key]
+
+    def _prune_task_cache(self, now: float) -> None:
+        """Drop overlay entries that every cached query already reflects."""
+        # Через QUERY_CACHE_TTL все закэшированные запросы уже содержат изменение.
+        # Записи хранятся в порядке изменения, поэтому останавливаемся на первой свежей
+        for task_id, (stamp, _) in list(self.task_cache.items()):
+            if now - stamp < QUERY_CACHE_TTL:
+                break
+            del self.task_cache[task_id]
+
+    def remember_task(self, page_id: str, page: dict) -> None:
+        """Record a page returned by an update to overlay it onto cached queries."""
+        now = asyncio.get_running_loop().time()
+        self._prune_task_cache(now)
+        self.task_cache.pop(page_id, None)
+        self.task_cache[page_id] = (now, page)
+
+    def merge_task_cache(self, tasks: list) -> list:
+        """Overlay pages updated by this server onto (possibly cached) query results."""
+        if not self.task_cache:
+            return tasks
+        self._prune_task_cache(asyncio.get_running_loop().time())
+        return [self.task_cache[task["id"]][1] if task["id"] in self.task_cache else task for task in tasks]
+
+# Версия HTTP логируется один раз, чтобы убедиться, что HTTP/2 согласован
+_http_version_logged = False
+
+async def _log_http_version(response: httpx.Response) -> None:
+    """Log the HTTP version negotiated with the Notion API on the first response."""
+    global _http_version_logged
+    if not _http_version_logged:
+        _http_version_logged = True
+        logger.debug("Notion API responded over %s", response.http_version)
+
+# Общий клиент на весь процесс: в stateless_http режиме lifespan входит
+# заново на каждый запрос, поэтому пул соединений держим вне его
+_notion_context: NotionContext | None = None
 
 # Определение функции жизненного цикла
 @asynccontextmanager
 async def notion_lifespan(server: FastMCP) -> AsyncIterator[NotionContext]:
     """Управление жизненным циклом подключения к Notion API"""
-    # Инициализация клиента при запуске
-    client = httpx.AsyncClient(headers=HEADERS)
-    logger.info("Initialized Notion API client")
-    try:
-        yield NotionContext(client=client)
-    finally:
-        # Закрытие клиента при завершении
-        await client.aclose()
+    global _notion_context
+    # Инициализация клиента при первом запуске, дальше переиспользуем keep-alive соединения
+    if _notion_context is None:
+        client = httpx.AsyncClient(
+            headers=_config().headers,
+            http2=True,
+            limits=httpx.Limits(
+                max_keepalive_connections=20,
+                max_connections=100,
+                keepalive_expiry=30.0,
+            ),
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            event_hooks={"response": [_log_http_version]},
+        )
+        _notion_context = NotionContext(client=client)
+        logger.info("Initialized Notion API client")
+    yield _notion_context
+
+async def _close_notion_client() -> None:
+    """Close the shared Notion client when the server shuts down."""
+    global _notion_context
+    if _notion_context is not None:
+        await _notion_context.client.aclose()
+        _notion_context = None
         logger.info("Closed Notion API client")
 
+class NotionMCP(FastMCP):
+    """FastMCP server that builds the tools/list response once and reuses it.
+    
+    In stateless HTTP mode every session starts with tools/list, while the
+    registered tools only change at import time.
+    """
+    
+    _tools_list: list[Tool] | None = None
+    
+    async def list_tools(self) -> list[Tool]:
+        """List all available tools, building the schemas on first use."""
+        if self._tools_list is None:
+            self._tools_list = await super().list_tools()
+        return self._tools_list
+    
+    def add_tool(self, *args, **kwargs) -> None:
+        self._tools_list = None
+        super().add_tool(*args, **kwargs)
+    
+    def remove_tool(self, name: str) -> None:
+        self._tools_list = None
+        super().remove_tool(name)
+
 # Initialize server with FastMCP and lifespan
-mcp = FastMCP("notion-todo", stateless_http=True, lifespan=notion_lifespan)
+mcp = NotionMCP("notion-todo", stateless_http=True, lifespan=notion_lifespan)
+
+async def _read_json(response: httpx.Response) -> Any:
+    """Read the response body and parse it with orjson."""
+    return orjson.loads(await response.aread())
 
 async def get_database_schema(ctx: Context) -> dict:
     """Get the schema of the Notion database."""
-    client = ctx.request_context.lifespan_context.client
-    response = await client.get(f"{NOTION_API_URL}/databases/{NOTION_DATABASE_ID}")
+    notion = ctx.request_context.lifespan_context
+    now = asyncio.get_running_loop().time()
+    if notion.schema_cache is not None and now - notion.schema_cache[0] < SCHEMA_CACHE_TTL:
+        return notion.schema_cache[1]
+    
+    response = await notion.client.get(f"{NOTION_API_URL}/databases/{_config().database_id}")
     response.raise_for_status()
-    return response.json()
+    schema = await _read_json(response)
+    notion.schema_cache = (now, schema)
+    return schema
 
-async def query_database(filter_params: dict = None, ctx: Context = None) -> list:
-    """Query the Notion database with optional filters."""
-    url = f"{NOTION_API_URL}/databases/{NOTION_DATABASE_ID}/query"
+async def _fetch_query(notion: NotionContext, key: bytes, payload: dict) -> dict:
+    """Run a database query against Notion and store the response in the cache."""
+    url = f"{NOTION_API_URL}/databases/{_config().database_id}/query"
+    generation = notion.generation
+    # Время фиксируем до отправки: ответ, начатый до PATCH, истечет раньше наложения task_cache
+    stamp = asyncio.get_running_loop().time()
+    
+    response = await notion.client.post(url, content=orjson.dumps(payload))
+    response.raise_for_status()
+    data = await _read_json(response)
+    
+    # Не кэшируем ответ, если база была изменена во время запроса
+    if generation == notion.generation:
+        notion.query_cache.pop(key, None)
+        if len(notion.query_cache) >= QUERY_CACHE_MAXSIZE:
+            notion.query_cache.pop(next(iter(notion.query_cache)))
+        notion.query_cache[key] = (stamp, data)
+    return data
+
+async def _refresh_query(notion: NotionContext, key: bytes, payload: dict) -> None:
+    """Refresh a cached query in the background."""
+    try:
+        await _fetch_query(notion, key, payload)
+    except Exception as e:
+        logger.warning("Error refreshing cached query: %s", e)
+    finally:
+        notion.refreshing.pop(key, None)
+
+async def query_database_page(ctx: Context, filter_params: dict = None) -> dict:
+    """Query one page of the Notion database with optional filters and pagination.
+    
+    Returns the raw Notion response with "results", "next_cursor" and
+    "has_more". Responses are cached for QUERY_CACHE_TTL seconds. Once an entry is older
+    than half the TTL it is still returned, and a refresh is scheduled in
+    the background.
+    """
+    notion = ctx.request_context.lifespan_context
     
     # Default payload with no filters
     payload = {}
@@ -91,40 +271,40 @@ async def query_database(filter_params: dict = None, ctx: Context = None) -> lis
     if filter_params:
         payload = filter_params
     
-    # Используем клиент из контекста, если он доступен
-    if ctx and ctx.request_context.lifespan_context:
-        client = ctx.request_context.lifespan_context.client
-        response = await client.post(url, json=payload)
-    else:
-        # Для обратной совместимости
-        async with httpx.AsyncClient(headers=HEADERS) as client:
-            response = await client.post(url, json=payload)
+    key = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    cached = notion.query_cache.get(key)
+    if cached is not None:
+        stamp, data = cached
+        age = asyncio.get_running_loop().time() - stamp
+        if age < QUERY_CACHE_TTL:
+            if age > QUERY_CACHE_TTL / 2 and key not in notion.refreshing:
+                notion.refreshing[key] = asyncio.create_task(_refresh_query(notion, key, payload))
+            return data
     
-    response.raise_for_status()
-    return response.json().get("results", [])
+    return await _fetch_query(notion, key, payload)
 
-async def create_page(properties: dict, ctx: Context = None) -> dict:
+async def query_database(ctx: Context, filter_params: dict = None) -> list:
+    """Query the Notion database with optional filters."""
+    data = await query_database_page(ctx=ctx, filter_params=filter_params)
+    return data.get("results", [])
+
+async def create_page(properties: dict, ctx: Context) -> dict:
     """Create a new page (task) in the Notion database."""
     url = f"{NOTION_API_URL}/pages"
     
     payload = {
-        "parent": {"database_id": NOTION_DATABASE_ID},
+        "parent": {"database_id": _config().database_id},
         "properties": properties,
     }
     
-    # Используем клиент из контекста, если он доступен
-    if ctx and ctx.request_context.lifespan_context:
-        client = ctx.request_context.lifespan_context.client
-        response = await client.post(url, json=payload)
-    else:
-        # Для обратной совместимости
-        async with httpx.AsyncClient(headers=HEADERS) as client:
-            response = await client.post(url, json=payload)
+    notion = ctx.request_context.lifespan_context
+    response = await notion.client.post(url, content=orjson.dumps(payload))
     
     response.raise_for_status()
-    return response.json()
+    notion.invalidate()
+    return await _read_json(response)
 
-async def update_page(page_id: str, properties: dict, ctx: Context = None) -> dict:
+async def update_page(page_id: str, properties: dict, ctx: Context) -> dict:
     """Update a page (task) in the Notion database."""
     url = f"{NOTION_API_URL}/pages/{page_id}"
     
@@ -132,55 +312,120 @@ async def update_page(page_id: str, properties: dict, ctx: Context = None) -> di
         "properties": properties,
     }
     
-    # Используем клиент из контекста, если он доступен
-    if ctx and ctx.request_context.lifespan_context:
-        client = ctx.request_context.lifespan_context.client
-        response = await client.patch(url, json=payload)
-    else:
-        # Для обратной совместимости
-        async with httpx.AsyncClient(headers=HEADERS) as client:
-            response = await client.patch(url, json=payload)
+    notion = ctx.request_context.lifespan_context
+    response = await notion.client.patch(url, content=orjson.dumps(payload))
     
     response.raise_for_status()
-    return response.json()
+    # Ответ PATCH уже содержит обновленную страницу: ее накладываем на списки без
+    # фильтра, а отфильтрованные запросы сбрасываем
+    page = await _read_json(response)
+    notion.remember_task(page_id, page)
+    notion.drop_filtered_queries()
+    return page
+
+# Префиксы статуса задачи: (выполнена, when в нижнем регистре) -> эмодзи.
+# Неизвестные значения when отображаются как "later"
+_STATUS_PREFIX = {
+    (True, "today"): "✅ 🔴 ",
+    (True, "later"): "✅ ⚪ ",
+    (False, "today"): "⬜ 🔴 ",
+    (False, "later"): "⬜ ⚪ ",
+}
+
+# Неизменяемые наборы свойств для обновлений: собираем один раз при загрузке модуля.
+# orjson сериализует их сразу при отправке, поэтому общие объекты безопасны
+_PROP_COMPLETED = {"Checkbox": {"checkbox": True}}
+_PROP_UNCOMPLETED = {"Checkbox": {"checkbox": False}}
+_WHEN_TODAY = {"When": {"select": {"name": "today"}}}
+_WHEN_LATER = {"When": {"select": {"name": "later"}}}
+_VALID_WHEN = frozenset({"today", "later"})
+
+def _normalize_when(when: str) -> tuple[str, dict]:
+    """Lowercase 'when' (unknown values become "later") and pick its property payload."""
+    w = when.lower()
+    if w not in _VALID_WHEN:
+        w = "later"
+    return w, (_WHEN_TODAY if w == "today" else _WHEN_LATER)
+
+def _status_prefix(completed: bool, when: str) -> str:
+    """Get the status emoji prefix for a task, treating unknown 'when' values as "later"."""
+    return _STATUS_PREFIX.get((completed, when.lower())) or _STATUS_PREFIX[(completed, "later")]
+
+def _task_resource(task: dict) -> Resource:
+    """Build the resource returned by tools for a Notion page."""
+    task_name, when, completed = _extract_task_fields(task)
+    return Resource(
+        id=task["id"],
+        uri=f"notion://task/{task['id']}",
+        name=_status_prefix(completed, when) + task_name,
+        description=f"When: {when}, Completed: {completed}",
+    )
+
+def _extract_task_fields(task: dict) -> tuple[str, str, bool]:
+    """Extract the name, 'when' value and completion flag from a Notion page."""
+    props = task["properties"]
+    title_list = props["Task"]["title"]
+    name = title_list[0]["text"]["content"] if title_list else "Untitled"
+    sel = props["When"]["select"]
+    when = sel["name"] if sel else "later"
+    done = props["Checkbox"]["checkbox"]
+    return name, when, done
 
-# Define available tools using FastMCP decorators
-@mcp.tool()
-async def list_tasks(ctx: Context) -> list[Resource]:
-    """List all tasks in the Notion database."""
+# Define available tools, registered with FastMCP below
+async def list_tasks(
+    ctx: Context,
+    when: str | None = None,
+    completed: bool | None = None,
+    page_size: int = 50,
+    start_cursor: str | None = None,
+) -> list[Resource]:
+    """List tasks in the Notion database.
+    
+    Optionally filter by 'when' ("today" or "later") and completion status.
+    Results are paginated; if more tasks are available, the last item
+    contains the next_cursor to pass as start_cursor.
+    """
     try:
-        tasks = await query_database(ctx=ctx)
+        # Фильтруем на стороне Notion, чтобы не тянуть лишние строки
+        conditions = []
+        if when is not None:
+            when = when.lower()
+            conditions.append({"property": "When", "select": {"equals": when}})
+        if completed is not None:
+            conditions.append({"property": "Checkbox", "checkbox": {"equals": completed}})
+        
+        filter_params = {"page_size": max(1, min(page_size, 100))}
+        if conditions:
+            filter_params["filter"] = {"and": conditions}
+        if start_cursor:
+            filter_params["start_cursor"] = start_cursor
+        
+        data = await query_database_page(ctx=ctx, filter_params=filter_params)
+        tasks = data.get("results", [])
+        # Отфильтрованные запросы сбрасываются при обновлении, наложение нужно только без фильтра
+        if not conditions:
+            tasks = ctx.request_context.lifespan_context.merge_task_cache(tasks)
+        
+        resources = [_task_resource(task) for task in tasks]
         
-        resources = []
-        for task in tasks:
-            task_name = task["properties"]["Task"]["title"][0]["text"]["content"] if task["properties"]["Task"]["title"] else "Untitled"
-            when = task["properties"]["When"]["select"]["name"] if task["properties"]["When"]["select"] else "later"
-            completed = task["properties"]["Checkbox"]["checkbox"]
-            
-            status = "✅ " if completed else "⬜ "
-            when_emoji = "🔴 " if when.lower() == "today" else "⚪ "
-            
-            resources.append(
-                Resource(
-                    id=task["id"],
-                    uri=f"notion://task/{task['id']}",
-                    name=f"{status}{when_emoji}{task_name}",
-                    description=f"When: {when}, Completed: {completed}",
-                )
-            )
+        next_cursor = data.get("next_cursor")
+        if data.get("has_more") and next_cursor:
+            resources.append(TextContent(
+                type="text",
+                text=f"More tasks available, next_cursor: {next_cursor}",
+                _meta={"next_cursor": next_cursor},
+            ))
         
         return resources
     except Exception as e:
-        logger.error(f"Error listing tasks: {e}")
+        logger.error("Error listing tasks: %s", e)
         return [TextContent(type="text", text=f"Error listing tasks: {str(e)}")]
 
-@mcp.tool()
 async def add_task(task_name: str, when: str = "later", ctx: Context = None) -> list[Resource]:
     """Add a new task to the Notion database."""
     try:
         # Validate 'when' parameter
-        if when.lower() not in ["today", "later"]:
-            when = "later"
+        w, when_props = _normalize_when(when)
         
         # Create properties for the new task
         properties = {
@@ -193,14 +438,8 @@ async def add_task(task_name: str, when: str = "later", ctx: Context = None) ->
                     }
                 ]
             },
-            "When": {
-                "select": {
-                    "name": when.lower()
-                }
-            },
-            "Checkbox": {
-                "checkbox": False
-            }
+            **when_props,
+            **_PROP_UNCOMPLETED,
         }
         
         # Create the task in Notion
@@ -210,126 +449,185 @@ async def add_task(task_name: str, when: str = "later", ctx: Context = None) ->
         return [Resource(
             id=new_task["id"],
             uri=f"notion://task/{new_task['id']}",
-            name=f"⬜ {'🔴 ' if when.lower() == 'today' else '⚪ '}{task_name}",
-            description=f"When: {when}, Completed: False",
+            name=_status_prefix(False, w) + task_name,
+            description=f"When: {w}, Completed: False",
         )]
     except Exception as e:
-        logger.error(f"Error adding task: {e}")
+        logger.error("Error adding task: %s", e)
         return [TextContent(type="text", text=f"Error adding task: {str(e)}")]
 
-@mcp.tool()
 async def complete_task(task_id: str, ctx: Context = None) -> list[Resource]:
     """Mark a task as completed."""
     try:
-        # Create properties to update
-        properties = {
-            "Checkbox": {
-                "checkbox": True
-            }
-        }
-        
         # Update the task in Notion
-        updated_task = await update_page(task_id, properties, ctx=ctx)
-        
-        # Get the task name and when value
-        task_name = updated_task["properties"]["Task"]["title"][0]["text"]["content"] if updated_task["properties"]["Task"]["title"] else "Untitled"
-        when = updated_task["properties"]["When"]["select"]["name"] if updated_task["properties"]["When"]["select"] else "later"
+        updated_task = await update_page(task_id, _PROP_COMPLETED, ctx=ctx)
         
         # Return the updated task as a resource
-        return [Resource(
-            id=updated_task["id"],
-            uri=f"notion://task/{updated_task['id']}",
-            name=f"✅ {'🔴 ' if when.lower() == 'today' else '⚪ '}{task_name}",
-            description=f"When: {when}, Completed: True",
-        )]
+        return [_task_resource(updated_task)]
     except Exception as e:
-        logger.error(f"Error completing task: {e}")
+        logger.error("Error completing task: %s", e)
         return [TextContent(type="text", text=f"Error completing task: {str(e)}")]
 
-@mcp.tool()
 async def uncomplete_task(task_id: str, ctx: Context = None) -> list[Resource]:
     """Mark a task as not completed."""
     try:
-        # Create properties to update
-        properties = {
-            "Checkbox": {
-                "checkbox": False
-            }
-        }
-        
         # Update the task in Notion
-        updated_task = await update_page(task_id, properties, ctx=ctx)
-        
-        # Get the task name and when value
-        task_name = updated_task["properties"]["Task"]["title"][0]["text"]["content"] if updated_task["properties"]["Task"]["title"] else "Untitled"
-        when = updated_task["properties"]["When"]["select"]["name"] if updated_task["properties"]["When"]["select"] else "later"
+        updated_task = await update_page(task_id, _PROP_UNCOMPLETED, ctx=ctx)
         
         # Return the updated task as a resource
-        return [Resource(
-            id=updated_task["id"],
-            uri=f"notion://task/{updated_task['id']}",
-            name=f"⬜ {'🔴 ' if when.lower() == 'today' else '⚪ '}{task_name}",
-            description=f"When: {when}, Completed: False",
-        )]
+        return [_task_resource(updated_task)]
     except Exception as e:
-        logger.error(f"Error uncompleting task: {e}")
+        logger.error("Error uncompleting task: %s", e)
         return [TextContent(type="text", text=f"Error uncompleting task: {str(e)}")]
 
-@mcp.tool()
 async def set_task_time(task_id: str, when: str, ctx: Context = None) -> list[Resource]:
     """Set when a task should be done."""
     try:
-        # Validate 'when' parameter
-        if when.lower() not in ["today", "later"]:
-            when = "later"
-        
-        # Create properties to update
-        properties = {
-            "When": {
-                "select": {
-                    "name": when.lower()
-                }
-            }
-        }
+        # Validate 'when' and pick the prebuilt properties to update
+        _, properties = _normalize_when(when)
         
         # Update the task in Notion
         updated_task = await update_page(task_id, properties, ctx=ctx)
         
-        # Get the task name and completed value
-        task_name = updated_task["properties"]["Task"]["title"][0]["text"]["content"] if updated_task["properties"]["Task"]["title"] else "Untitled"
-        completed = updated_task["properties"]["Checkbox"]["checkbox"]
-        
         # Return the updated task as a resource
-        return [Resource(
-            id=updated_task["id"],
-            uri=f"notion://task/{updated_task['id']}",
-            name=f"{'✅ ' if completed else '⬜ '}{'🔴 ' if when.lower() == 'today' else '⚪ '}{task_name}",
-            description=f"When: {when}, Completed: {completed}",
-        )]
+        return [_task_resource(updated_task)]
     except Exception as e:
-        logger.error(f"Error setting task time: {e}")
+        logger.error("Error setting task time: %s", e)
         return [TextContent(type="text", text=f"Error setting task time: {str(e)}")]
 
-async def main():
-    """Run the MCP server with Streamable HTTP transport."""
+# Notion ограничивает частоту запросов (~3 в секунду), поэтому пакетные
+# обновления отправляем не более чем по BATCH_CONCURRENCY одновременно
+BATCH_CONCURRENCY = 3
+
+async def _update_tasks(task_ids: list[str], properties: dict, action: str, ctx: Context) -> list[Resource]:
+    """Apply the same property update to several tasks concurrently."""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def update(task_id: str) -> Resource:
+        async with semaphore:
+            page = await update_page(task_id, properties, ctx=ctx)
+        return _task_resource(page)
+    
+    # PATCH-запросы идут через общий пул соединений; некорректная страница
+    # или ошибка API попадают в отчет, не ломая ответ для остальных задач
+    results = await asyncio.gather(*(update(task_id) for task_id in task_ids), return_exceptions=True)
+    
+    resources = []
+    errors = []
+    for task_id, result in zip(task_ids, results):
+        if isinstance(result, Exception):
+            logger.error("Error %s task %s: %s", action, task_id, result)
+            errors.append(f"{task_id}: {result}")
+        else:
+            resources.append(result)
+    
+    if errors:
+        resources.append(TextContent(type="text", text=f"Error {action} tasks: " + "; ".join(errors)))
+    return resources
+
+async def complete_tasks(task_ids: list[str], ctx: Context = None) -> list[Resource]:
+    """Mark several tasks as completed."""
+    return await _update_tasks(task_ids, _PROP_COMPLETED, "completing", ctx)
+
+async def uncomplete_tasks(task_ids: list[str], ctx: Context = None) -> list[Resource]:
+    """Mark several tasks as not completed."""
+    return await _update_tasks(task_ids, _PROP_UNCOMPLETED, "uncompleting", ctx)
+
+async def set_task_times(task_ids: list[str], when: str, ctx: Context = None) -> list[Resource]:
+    """Set when several tasks should be done."""
+    _, properties = _normalize_when(when)
+    return await _update_tasks(task_ids, properties, "setting time for", ctx)
+
+def _is_enabled(name: str) -> bool:
+    """Check whether a tool is allowed by ENABLED_TOOLS and DISABLED_TOOLS."""
+    if ENABLED_TOOLS and name not in ENABLED_TOOLS:
+        return False
+    return name not in DISABLED_TOOLS
+
+TOOLS = {
+    "list_tasks": list_tasks,
+    "add_task": add_task,
+    "complete_task": complete_task,
+    "uncomplete_task": uncomplete_task,
+    "set_task_time": set_task_time,
+    "complete_tasks": complete_tasks,
+    "uncomplete_tasks": uncomplete_tasks,
+    "set_task_times": set_task_times,
+}
+
+_server_ready = False
+
+def setup_server(env_file: Path | None = env_path) -> None:
+    """Load .env, configure logging and register the enabled tools, once per process.
+    
+    Variables already set in the process environment take precedence over
+    env_file; pass env_file=None to use the process environment only.
+    """
+    global ENABLED_TOOLS, DISABLED_TOOLS, _server_ready
+    if _server_ready:
+        return
+    _server_ready = True
+    
+    if env_file is not None and env_file.exists():
+        load_dotenv(env_file)
+    _configure_logging()
+    
+    ENABLED_TOOLS = _tool_names("ENABLED_TOOLS")
+    DISABLED_TOOLS = _tool_names("DISABLED_TOOLS")
+    # Регистрируем только разрешенные инструменты. Structured output отключен:
+    # иначе FastMCP повторно валидирует и сериализует каждую строку результата,
+    # а ошибки и next_cursor (TextContent) не проходят схему list[Resource]
+    for name, fn in TOOLS.items():
+        if _is_enabled(name):
+            mcp.tool(structured_output=False)(fn)
+
+def run_server(argv=None) -> None:
+    """Run main() on uvloop when it is available, otherwise on asyncio."""
+    try:
+        import uvloop
+    except ImportError:
+        # uvloop не поддерживает Windows, остаемся на стандартном цикле
+        asyncio.run(main(argv))
+        return
+    uvloop.run(main(argv))
+
+# Хосты, для которых FastMCP включает защиту от DNS rebinding
+_LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+async def main(argv=None):
+    """Run the MCP server with Streamable HTTP transport.
+    
+    argv overrides the command line arguments (defaults to sys.argv[1:]).
+    """
     parser = argparse.ArgumentParser(description='Run the Notion MCP server')
     parser.add_argument('--host', type=str, default='127.0.0.1', help='Host to bind the server to')
     parser.add_argument('--port', type=int, default=8000, help='Port to bind the server to')
-    parser.add_argument('--transport', type=str, default='streamable-http', help='Transport to use (streamable-http or sse)')
-    args = parser.parse_args()
+    parser.add_argument('--transport', type=str, default='streamable-http', choices=['streamable-http', 'stdio'], help='Transport to use (streamable-http or stdio)')
+    args = parser.parse_args(argv)
+    
+    # Read .env, set up logging and tools, then validate the configuration before accepting requests
+    setup_server()
+    _config()
     
     # Start the server with the specified transport
-    logger.info(f"Starting Notion MCP server on {args.host}:{args.port} with {args.transport} transport")
+    logger.info("Starting Notion MCP server on %s:%s with %s transport (SSE is no longer supported)", args.host, args.port, args.transport)
     
     # Используем асинхронные методы напрямую
-    if args.transport == 'streamable-http':
-        logger.info(f"MCP API will be available at http://{args.host}:{args.port}/")
-        await mcp.run_streamable_http_async()
-    else:
-        # Для других транспортов используем соответствующие методы
-        await mcp.run_stdio_async()
+    try:
+        if args.transport == 'streamable-http':
+            mcp.settings.host = args.host
+            mcp.settings.port = args.port
+            # FastMCP ограничивает Host заголовок loopback-адресами, если сервер создан
+            # с хостом по умолчанию; для внешнего адреса защита не нужна, как и в самом FastMCP
+            if args.host not in _LOOPBACK_HOSTS:
+                mcp.settings.transport_security = None
+            logger.info("MCP API will be available at http://%s:%s/", args.host, args.port)
+            await mcp.run_streamable_http_async()
+        else:
+            await mcp.run_stdio_async()
+    finally:
+        await _close_notion_client()
 
 # Для обратной совместимости, если файл запускается напрямую
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
\ No newline at end of file
+    run_server()
\ No newline at end of file
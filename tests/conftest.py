@@ -0,0 +1,10 @@
+import os
+
+def pytest_configure(config):
+    """Provide Notion credentials and default server settings before test modules import notion_mcp.server."""
+    os.environ.setdefault("NOTION_API_KEY", "test_api_key")
+    os.environ.setdefault("NOTION_DATABASE_ID", "test_database_id")
+    # A developer's shell or .env must not change which tools the tests see
+    os.environ["ENABLED_TOOLS"] = ""
+    os.environ["DISABLED_TOOLS"] = ""
+    os.environ["LOG_LEVEL"] = "WARNING"
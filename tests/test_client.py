@@ -20,19 +20,16 @@ def client(mock_transport):
     """Create a client with mocked transport."""
     return Client(transport=mock_transport)
 
-@pytest.mark.asyncio
 async def test_client_connect(client, mock_transport):
     """Test client connect method."""
     await client.connect()
     mock_transport.connect.assert_called_once()
 
-@pytest.mark.asyncio
 async def test_client_disconnect(client, mock_transport):
     """Test client disconnect method."""
     await client.disconnect()
     mock_transport.disconnect.assert_called_once()
 
-@pytest.mark.asyncio
 async def test_list_tools(client, mock_transport):
     """Test listing tools from the server."""
     # Mock the receive method to return a list of tools
@@ -67,7 +64,6 @@ async def test_list_tools(client, mock_transport):
     assert sent_msg["method"] == "mcp.list_tools"
     assert sent_msg["id"] == 1
 
-@pytest.mark.asyncio
 async def test_call_tool(client, mock_transport):
     """Test calling a tool on the server."""
     # Mock tasks to be returned
@@ -108,7 +104,6 @@ async def test_call_tool(client, mock_transport):
     assert sent_msg["params"]["name"] == "list_tasks"
     assert sent_msg["id"] == 1
 
-@pytest.mark.asyncio
 async def test_call_tool_with_args(client, mock_transport):
     """Test calling a tool with arguments."""
     # Mock task to be returned
@@ -144,7 +139,6 @@ async def test_call_tool_with_args(client, mock_transport):
     assert sent_msg["params"]["arguments"]["when"] == "today"
     assert sent_msg["id"] == 1
 
-@pytest.mark.asyncio
 async def test_streamable_http_client_integration():
     """Test creating a client with StreamableHttpClient."""
     # Mock the StreamableHttpClient class
@@ -1,21 +1,69 @@
 import pytest
 import os
 import asyncio
-from unittest.mock import patch, AsyncMock, MagicMock
+import logging
+import orjson
+import httpx
+from functools import partialmethod
+from types import SimpleNamespace
+from unittest.mock import patch
 from mcp.server.fastmcp import FastMCP
+import notion_mcp.server as notion_server
 from notion_mcp.server import (
     mcp,
+    NotionContext,
     list_tasks,
     add_task,
     complete_task,
     uncomplete_task,
     set_task_time,
+    complete_tasks,
+    uncomplete_tasks,
+    set_task_times,
     query_database,
+    get_database_schema,
     create_page,
-    update_page
+    update_page,
+    main,
+    _config,
+    _is_enabled
 )
 
-@pytest.fixture
+# Expected request fragments for the test credentials set in conftest.py
+_AUTH = "Bearer test_api_key"
+_QUERY_FRAG = "databases/test_database_id/query"
+_PAGES_FRAG = "pages"
+
+def _task(task_id, name, when, checkbox):
+    """Build a Notion page for a task."""
+    return {
+        "id": task_id,
+        "properties": {
+            "Task": {"title": [{"text": {"content": name}}]},
+            "When": {"select": {"name": when}},
+            "Checkbox": {"checkbox": checkbox}
+        }
+    }
+
+# Shared Notion payloads, allocated once; tests must not mutate them
+_TASK_TODAY_UNCHECKED = _task("task1", "Test task 1", "today", False)
+_TASK_TODAY_CHECKED = _task("task1", "Test task 1", "today", True)
+_TASK_LATER_CHECKED = _task("task2", "Test task 2", "later", True)
+_TASK_LATER_UNCHECKED = _task("task2", "Test task 2", "later", False)
+_NEW_TASK = _task("new_task_id", "New task", "today", False)
+
+def _async_return(value):
+    """Build a coroutine function that ignores its arguments and returns value."""
+    async def _stub(*args, **kwargs):
+        return value
+    return _stub
+
+@pytest.fixture(scope="session", autouse=True)
+def server_setup():
+    """Register the tools from the process environment only, ignoring any local .env."""
+    notion_server.setup_server(env_file=None)
+
+@pytest.fixture(scope="session")
 def mock_env_vars():
     """Mock environment variables needed for tests."""
     with patch.dict(os.environ, {
@@ -24,226 +72,519 @@ def mock_env_vars():
     }):
         yield
 
-@pytest.fixture
+def _advance(notion, seconds):
+    """Age every cached query and updated task as if seconds had passed."""
+    for cache in (notion.query_cache, notion.task_cache):
+        for key, (stamp, value) in cache.items():
+            cache[key] = (stamp - seconds, value)
+
+def _fake_resp(payload):
+    """Build a stand-in for an httpx response carrying a JSON payload."""
+    return SimpleNamespace(
+        raise_for_status=lambda: None,
+        aread=_async_return(orjson.dumps(payload))
+    )
+
+class _FakeClient:
+    """Minimal stand-in for httpx.AsyncClient that records every request."""
+    
+    def __init__(self):
+        self.calls = []
+        self.responses = {}
+        self._default = _fake_resp({"results": []})
+    
+    def reset(self):
+        self.calls.clear()
+        self.responses.clear()
+    
+    async def _request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs))
+        return self.responses.get(method, self._default)
+    
+    get = partialmethod(_request, "get")
+    post = partialmethod(_request, "post")
+    patch = partialmethod(_request, "patch")
+
+# Canned responses shared by the CRUD tests; the body is serialized once
+_RESP_NEW_TASK = _fake_resp(_NEW_TASK)
+_RESP_TODAY_CHECKED = _fake_resp(_TASK_TODAY_CHECKED)
+
+@pytest.fixture(scope="session")
 def mock_httpx_client():
-    """Mock httpx AsyncClient for API calls."""
-    with patch("httpx.AsyncClient") as mock_client:
-        mock_instance = AsyncMock()
-        mock_response = MagicMock()
-        mock_response.raise_for_status = AsyncMock()
-        mock_response.json = MagicMock(return_value={"results": []})
-        mock_instance.__aenter__.return_value.get = AsyncMock(return_value=mock_response)
-        mock_instance.__aenter__.return_value.post = AsyncMock(return_value=mock_response)
-        mock_instance.__aenter__.return_value.patch = AsyncMock(return_value=mock_response)
-        mock_client.return_value = mock_instance
-        yield mock_client
-
-@pytest.mark.asyncio
-async def test_query_database(mock_env_vars, mock_httpx_client):
+    """Fake shared httpx AsyncClient used for API calls."""
+    return _FakeClient()
+
+@pytest.fixture(autouse=True)
+def reset_httpx_client(mock_httpx_client):
+    """Clear recorded calls and per-test responses on the shared fake client."""
+    yield
+    mock_httpx_client.reset()
+
+@pytest.fixture
+def mock_ctx(mock_httpx_client):
+    """Mock MCP request context exposing the lifespan Notion client."""
+    return SimpleNamespace(
+        request_context=SimpleNamespace(
+            lifespan_context=NotionContext(client=mock_httpx_client)
+        )
+    )
+
+def test_config_headers(mock_env_vars):
+    """Test the shared client headers carry the Notion API key."""
+    assert _config().headers["Authorization"] == _AUTH
+
+async def test_query_database(mock_env_vars, mock_httpx_client, mock_ctx):
     """Test query_database function."""
-    result = await query_database()
+    result = await query_database(ctx=mock_ctx)
     assert result == []
     
     # Verify API call was made correctly
-    mock_instance = mock_httpx_client.return_value.__aenter__.return_value
-    mock_instance.post.assert_called_once()
-    args, kwargs = mock_instance.post.call_args
-    assert "databases/test_database_id/query" in args[0]
-    assert kwargs["headers"]["Authorization"] == "Bearer test_api_key"
-
-@pytest.mark.asyncio
-async def test_create_page(mock_env_vars, mock_httpx_client):
+    assert len(mock_httpx_client.calls) == 1
+    method, url, kwargs = mock_httpx_client.calls[0]
+    assert method == "post"
+    assert _QUERY_FRAG in url
+
+async def test_query_database_cache(mock_env_vars, mock_httpx_client, mock_ctx):
+    """Test query_database serves repeated queries from the cache until a write."""
+    await query_database(ctx=mock_ctx)
+    await query_database(ctx=mock_ctx)
+    assert len(mock_httpx_client.calls) == 1
+    
+    # A write invalidates cached results
+    await create_page({"Checkbox": {"checkbox": False}}, ctx=mock_ctx)
+    await query_database(ctx=mock_ctx)
+    query_calls = [url for _, url, _ in mock_httpx_client.calls if url.endswith("/query")]
+    assert len(query_calls) == 2
+
+async def test_query_database_stale_while_revalidate(mock_env_vars, mock_httpx_client, mock_ctx):
+    """Test a stale cached query is served immediately and refreshed in the background."""
+    notion = mock_ctx.request_context.lifespan_context
+    mock_httpx_client.responses["post"] = _fake_resp({"results": [_TASK_TODAY_UNCHECKED]})
+    await query_database(ctx=mock_ctx)
+    
+    # Age the entry past half the TTL
+    key, (stamp, data) = next(iter(notion.query_cache.items()))
+    notion.query_cache[key] = (stamp - notion_server.QUERY_CACHE_TTL * 0.75, data)
+    mock_httpx_client.responses["post"] = _fake_resp({"results": [_TASK_TODAY_CHECKED]})
+    
+    assert await query_database(ctx=mock_ctx) == [_TASK_TODAY_UNCHECKED]
+    refresh = notion.refreshing[key]
+    assert await query_database(ctx=mock_ctx) == [_TASK_TODAY_UNCHECKED]
+    assert list(notion.refreshing.values()) == [refresh]
+    
+    await refresh
+    assert notion.refreshing == {}
+    assert await query_database(ctx=mock_ctx) == [_TASK_TODAY_CHECKED]
+    assert len(mock_httpx_client.calls) == 2
+
+async def test_query_database_expired(mock_env_vars, mock_httpx_client, mock_ctx):
+    """Test a cached query older than the TTL is fetched again before returning."""
+    notion = mock_ctx.request_context.lifespan_context
+    await query_database(ctx=mock_ctx)
+    key, (stamp, data) = next(iter(notion.query_cache.items()))
+    notion.query_cache[key] = (stamp - notion_server.QUERY_CACHE_TTL, data)
+    mock_httpx_client.responses["post"] = _fake_resp({"results": [_NEW_TASK]})
+    
+    assert await query_database(ctx=mock_ctx) == [_NEW_TASK]
+    assert notion.refreshing == {}
+    assert len(mock_httpx_client.calls) == 2
+
+async def test_database_schema_cache(mock_env_vars, mock_httpx_client, mock_ctx, monkeypatch):
+    """Test the database schema is fetched once per SCHEMA_CACHE_TTL."""
+    mock_httpx_client.responses["get"] = _fake_resp({"id": "test_database_id"})
+    
+    assert await get_database_schema(mock_ctx) == {"id": "test_database_id"}
+    await get_database_schema(mock_ctx)
+    assert len(mock_httpx_client.calls) == 1
+    
+    monkeypatch.setattr("notion_mcp.server.SCHEMA_CACHE_TTL", 0.0)
+    await get_database_schema(mock_ctx)
+    assert [method for method, _, _ in mock_httpx_client.calls] == ["get", "get"]
+
+async def test_query_database_http_error(mock_env_vars, mock_httpx_client, mock_ctx):
+    """Test errors from the synchronous raise_for_status propagate and are not cached."""
+    def raise_for_status():
+        raise httpx.HTTPError("503 Service Unavailable")
+    
+    mock_httpx_client.responses["post"] = SimpleNamespace(raise_for_status=raise_for_status)
+    with pytest.raises(httpx.HTTPError):
+        await query_database(ctx=mock_ctx)
+    
+    # The next query goes to Notion again
+    mock_httpx_client.responses.clear()
+    assert await query_database(ctx=mock_ctx) == []
+    assert len(mock_httpx_client.calls) == 2
+
+async def test_create_page(mock_env_vars, mock_httpx_client, mock_ctx):
     """Test create_page function."""
-    mock_properties = {
-        "Task": {"title": [{"text": {"content": "Test task"}}]},
-        "When": {"select": {"name": "today"}},
-        "Checkbox": {"checkbox": False}
-    }
+    mock_properties = _NEW_TASK["properties"]
     
     # Configure mock response for create_page
-    mock_response = MagicMock()
-    mock_response.raise_for_status = AsyncMock()
-    mock_response.json = MagicMock(return_value={"id": "test_page_id", "properties": mock_properties})
-    mock_httpx_client.return_value.__aenter__.return_value.post.return_value = mock_response
+    mock_httpx_client.responses["post"] = _RESP_NEW_TASK
     
-    result = await create_page(mock_properties)
+    result = await create_page(mock_properties, ctx=mock_ctx)
     
-    assert result["id"] == "test_page_id"
+    assert result["id"] == "new_task_id"
     # Verify API call was made correctly
-    mock_instance = mock_httpx_client.return_value.__aenter__.return_value
-    mock_instance.post.assert_called_once()
-    args, kwargs = mock_instance.post.call_args
-    assert "pages" in args[0]
-    assert kwargs["json"]["parent"]["database_id"] == "test_database_id"
-    assert kwargs["json"]["properties"] == mock_properties
-
-@pytest.mark.asyncio
-async def test_update_page(mock_env_vars, mock_httpx_client):
+    assert len(mock_httpx_client.calls) == 1
+    method, url, kwargs = mock_httpx_client.calls[0]
+    assert method == "post"
+    assert _PAGES_FRAG in url
+    payload = orjson.loads(kwargs["content"])
+    assert payload["parent"]["database_id"] == "test_database_id"
+    assert payload["properties"] == mock_properties
+
+async def test_update_page(mock_env_vars, mock_httpx_client, mock_ctx):
     """Test update_page function."""
     mock_properties = {"Checkbox": {"checkbox": True}}
-    page_id = "test_page_id"
+    page_id = _TASK_TODAY_CHECKED["id"]
     
     # Configure mock response for update_page
-    mock_response = MagicMock()
-    mock_response.raise_for_status = AsyncMock()
-    mock_response.json = MagicMock(return_value={
-        "id": page_id,
-        "properties": {
-            "Task": {"title": [{"text": {"content": "Test task"}}]},
-            "When": {"select": {"name": "today"}},
-            "Checkbox": {"checkbox": True}
-        }
-    })
-    mock_httpx_client.return_value.__aenter__.return_value.patch.return_value = mock_response
+    mock_httpx_client.responses["patch"] = _RESP_TODAY_CHECKED
     
-    result = await update_page(page_id, mock_properties)
+    result = await update_page(page_id, mock_properties, ctx=mock_ctx)
     
     assert result["id"] == page_id
     assert result["properties"]["Checkbox"]["checkbox"] is True
     # Verify API call was made correctly
-    mock_instance = mock_httpx_client.return_value.__aenter__.return_value
-    mock_instance.patch.assert_called_once()
-    args, kwargs = mock_instance.patch.call_args
-    assert f"pages/{page_id}" in args[0]
-    assert kwargs["json"]["properties"] == mock_properties
-
-@pytest.mark.asyncio
-async def test_list_tasks(mock_env_vars):
+    assert len(mock_httpx_client.calls) == 1
+    method, url, kwargs = mock_httpx_client.calls[0]
+    assert method == "patch"
+    assert f"{_PAGES_FRAG}/{page_id}" in url
+    assert orjson.loads(kwargs["content"])["properties"] == mock_properties
+
+async def test_list_tasks(mock_env_vars, mock_ctx, monkeypatch):
     """Test list_tasks function."""
     # Mock query_database to return sample tasks
-    mock_tasks = [
-        {
-            "id": "task1",
-            "properties": {
-                "Task": {"title": [{"text": {"content": "Test task 1"}}]},
-                "When": {"select": {"name": "today"}},
-                "Checkbox": {"checkbox": False}
-            }
-        },
-        {
-            "id": "task2",
-            "properties": {
-                "Task": {"title": [{"text": {"content": "Test task 2"}}]},
-                "When": {"select": {"name": "later"}},
-                "Checkbox": {"checkbox": True}
-            }
-        }
-    ]
-    
-    with patch("notion_mcp.server.query_database", return_value=mock_tasks):
-        result = await list_tasks()
-        
-        assert len(result) == 2
-        assert result[0].id == "task1"
-        assert "Test task 1" in result[0].name
-        assert "today" in result[0].description
-        assert result[1].id == "task2"
-        assert "Test task 2" in result[1].name
-        assert "later" in result[1].description
-
-@pytest.mark.asyncio
-async def test_add_task(mock_env_vars):
+    mock_tasks = [_TASK_TODAY_UNCHECKED, _TASK_LATER_CHECKED]
+    
+    monkeypatch.setattr("notion_mcp.server.query_database_page", _async_return({"results": mock_tasks}))
+    result = await list_tasks(mock_ctx)
+    
+    assert len(result) == 2
+    assert result[0].id == "task1"
+    assert "Test task 1" in result[0].name
+    assert "today" in result[0].description
+    assert result[1].id == "task2"
+    assert "Test task 2" in result[1].name
+    assert "later" in result[1].description
+
+async def test_list_tasks_filters(mock_env_vars, mock_httpx_client, mock_ctx):
+    """Test list_tasks sends filters and pagination to Notion and returns the next cursor."""
+    mock_httpx_client.responses["post"] = _fake_resp({"results": [], "has_more": True, "next_cursor": "cursor2"})
+    
+    result = await list_tasks(mock_ctx, when="Today", completed=False, page_size=10, start_cursor="cursor1")
+    
+    method, url, kwargs = mock_httpx_client.calls[-1]
+    payload = orjson.loads(kwargs["content"])
+    assert payload["filter"] == {"and": [
+        {"property": "When", "select": {"equals": "today"}},
+        {"property": "Checkbox", "checkbox": {"equals": False}}
+    ]}
+    assert payload["page_size"] == 10
+    assert payload["start_cursor"] == "cursor1"
+    assert len(result) == 1
+    assert result[0].meta == {"next_cursor": "cursor2"}
+
+async def test_list_tasks_reflects_update(mock_env_vars, mock_httpx_client, mock_ctx):
+    """Test list_tasks shows updated pages without querying Notion again."""
+    mock_httpx_client.responses["post"] = _fake_resp({"results": [_TASK_TODAY_UNCHECKED]})
+    mock_httpx_client.responses["patch"] = _RESP_TODAY_CHECKED
+    
+    result = await list_tasks(mock_ctx)
+    assert "⬜" in result[0].name
+    
+    await update_page("task1", {"Checkbox": {"checkbox": True}}, ctx=mock_ctx)
+    result = await list_tasks(mock_ctx)
+    
+    assert "✅" in result[0].name
+    assert [method for method, _, _ in mock_httpx_client.calls] == ["post", "patch"]
+
+async def test_list_tasks_today_after_set_task_time(mock_env_vars, mock_httpx_client, mock_ctx):
+    """Test a task moved to today shows up in an already cached today listing."""
+    assert await list_tasks(mock_ctx, when="today") == []
+    
+    mock_httpx_client.responses["patch"] = _fake_resp(_TASK_TODAY_UNCHECKED)
+    mock_httpx_client.responses["post"] = _fake_resp({"results": [_TASK_TODAY_UNCHECKED]})
+    await set_task_time("task1", "today", ctx=mock_ctx)
+    result = await list_tasks(mock_ctx, when="today")
+    
+    assert [r.id for r in result] == ["task1"]
+    assert [method for method, _, _ in mock_httpx_client.calls] == ["post", "patch", "post"]
+
+async def test_list_tasks_completed_after_complete_task(mock_env_vars, mock_httpx_client, mock_ctx):
+    """Test a completed task shows up in an already cached completed listing."""
+    assert await list_tasks(mock_ctx, completed=True) == []
+    
+    mock_httpx_client.responses["patch"] = _RESP_TODAY_CHECKED
+    mock_httpx_client.responses["post"] = _fake_resp({"results": [_TASK_TODAY_CHECKED]})
+    await complete_task("task1", ctx=mock_ctx)
+    result = await list_tasks(mock_ctx, completed=True)
+    
+    assert [r.id for r in result] == ["task1"]
+    assert "✅" in result[0].name
+    assert [method for method, _, _ in mock_httpx_client.calls] == ["post", "patch", "post"]
+
+async def test_task_cache_pruned_on_update(mock_env_vars, mock_httpx_client, mock_ctx):
+    """Test updated pages leave the overlay once expired, even without unfiltered listings."""
+    notion = mock_ctx.request_context.lifespan_context
+    mock_httpx_client.responses["patch"] = _RESP_TODAY_CHECKED
+    await update_page("task1", {"Checkbox": {"checkbox": True}}, ctx=mock_ctx)
+    await update_page("task2", {"Checkbox": {"checkbox": True}}, ctx=mock_ctx)
+    
+    _advance(notion, notion_server.QUERY_CACHE_TTL)
+    await update_page("task3", {"Checkbox": {"checkbox": True}}, ctx=mock_ctx)
+    
+    assert list(notion.task_cache) == ["task3"]
+
+async def test_list_tasks_refresh_racing_update(mock_env_vars, mock_httpx_client, mock_ctx, monkeypatch):
+    """Test a refresh sent before an update does not outlive the updated task."""
+    notion = mock_ctx.request_context.lifespan_context
+    mock_httpx_client.responses["post"] = _fake_resp({"results": [_TASK_TODAY_UNCHECKED]})
+    mock_httpx_client.responses["patch"] = _RESP_TODAY_CHECKED
+    await list_tasks(mock_ctx)
+    
+    # Start a background refresh and hold its response until after the update
+    _advance(notion, notion_server.QUERY_CACHE_TTL * 0.75)
+    gate = asyncio.Event()
+    sent = []
+    async def gated_post(url, **kwargs):
+        sent.append(url)
+        await gate.wait()
+        return _fake_resp({"results": [_TASK_TODAY_UNCHECKED]})
+    
+    monkeypatch.setattr(mock_httpx_client, "post", gated_post)
+    await list_tasks(mock_ctx)
+    refresh = next(iter(notion.refreshing.values()))
+    # Let the refresh send its request before the update
+    await asyncio.sleep(0)
+    assert len(sent) == 1
+    
+    await update_page("task1", {"Checkbox": {"checkbox": True}}, ctx=mock_ctx)
+    gate.set()
+    await refresh
+    
+    # Nothing cached from before the update may outlive the updated task
+    updated_at = notion.task_cache["task1"][0]
+    assert all(stamp < updated_at for stamp, _ in notion.query_cache.values())
+    
+    _advance(notion, notion_server.QUERY_CACHE_TTL)
+    monkeypatch.setattr(mock_httpx_client, "post", _async_return(_fake_resp({"results": [_TASK_TODAY_CHECKED]})))
+    result = await list_tasks(mock_ctx)
+    
+    assert "✅" in result[0].name
+
+async def test_add_task(mock_env_vars, monkeypatch):
     """Test add_task function."""
     # Mock create_page to return a sample task
-    mock_task = {
-        "id": "new_task_id",
-        "properties": {
-            "Task": {"title": [{"text": {"content": "New task"}}]},
-            "When": {"select": {"name": "today"}},
-            "Checkbox": {"checkbox": False}
-        }
-    }
+    monkeypatch.setattr("notion_mcp.server.create_page", _async_return(_NEW_TASK))
+    result = await add_task("New task", "today")
     
-    with patch("notion_mcp.server.create_page", return_value=mock_task):
-        result = await add_task("New task", "today")
-        
-        assert len(result) == 1
-        assert result[0].id == "new_task_id"
-        assert "New task" in result[0].name
-        assert "today" in result[0].description
-        assert "False" in result[0].description
-
-@pytest.mark.asyncio
-async def test_complete_task(mock_env_vars):
-    """Test complete_task function."""
-    # Mock update_page to return an updated task
-    mock_task = {
-        "id": "task_id",
-        "properties": {
-            "Task": {"title": [{"text": {"content": "Test task"}}]},
-            "When": {"select": {"name": "today"}},
-            "Checkbox": {"checkbox": True}
-        }
-    }
+    assert len(result) == 1
+    assert result[0].id == "new_task_id"
+    assert "New task" in result[0].name
+    assert "today" in result[0].description
+    assert "False" in result[0].description
+
+@pytest.mark.parametrize("fn,args,mock_task,emoji", [
+    (complete_task, ("task1",), _TASK_TODAY_CHECKED, "✅"),
+    (uncomplete_task, ("task1",), _TASK_TODAY_UNCHECKED, "⬜"),
+    (set_task_time, ("task2", "later"), _TASK_LATER_UNCHECKED, "⚪"),
+])
+async def test_update_task_tools(mock_env_vars, monkeypatch, fn, args, mock_task, emoji):
+    """Test complete_task, uncomplete_task and set_task_time functions."""
+    when = mock_task["properties"]["When"]["select"]["name"]
+    checkbox = mock_task["properties"]["Checkbox"]["checkbox"]
     
-    with patch("notion_mcp.server.update_page", return_value=mock_task):
-        result = await complete_task("task_id")
-        
-        assert len(result) == 1
-        assert result[0].id == "task_id"
-        assert "Test task" in result[0].name
-        assert "✅" in result[0].name
-        assert "True" in result[0].description
-
-@pytest.mark.asyncio
-async def test_uncomplete_task(mock_env_vars):
-    """Test uncomplete_task function."""
-    # Mock update_page to return an updated task
-    mock_task = {
-        "id": "task_id",
-        "properties": {
-            "Task": {"title": [{"text": {"content": "Test task"}}]},
-            "When": {"select": {"name": "today"}},
-            "Checkbox": {"checkbox": False}
-        }
-    }
+    # Mock update_page to return the updated task
+    monkeypatch.setattr("notion_mcp.server.update_page", _async_return(mock_task))
+    result = await fn(*args)
     
-    with patch("notion_mcp.server.update_page", return_value=mock_task):
-        result = await uncomplete_task("task_id")
-        
-        assert len(result) == 1
-        assert result[0].id == "task_id"
-        assert "Test task" in result[0].name
-        assert "⬜" in result[0].name
-        assert "False" in result[0].description
-
-@pytest.mark.asyncio
-async def test_set_task_time(mock_env_vars):
-    """Test set_task_time function."""
-    # Mock update_page to return an updated task
-    mock_task = {
-        "id": "task_id",
-        "properties": {
-            "Task": {"title": [{"text": {"content": "Test task"}}]},
-            "When": {"select": {"name": "later"}},
-            "Checkbox": {"checkbox": False}
-        }
-    }
+    assert len(result) == 1
+    assert result[0].id == args[0]
+    assert "Test task" in result[0].name
+    assert emoji in result[0].name
+    assert f"When: {when}" in result[0].description
+    assert f"Completed: {checkbox}" in result[0].description
+
+async def test_complete_tasks(mock_env_vars, monkeypatch):
+    """Test complete_tasks updates every task and reports failures."""
+    async def fake_update_page(task_id, properties, ctx=None):
+        if task_id == "missing":
+            raise ValueError("not found")
+        if task_id == "malformed":
+            return {"id": task_id, "properties": {}}
+        return _task(task_id, f"Task {task_id}", "today", True)
+    
+    monkeypatch.setattr("notion_mcp.server.update_page", fake_update_page)
+    result = await complete_tasks(["task1", "missing", "task2", "malformed"])
+    
+    assert [r.id for r in result[:2]] == ["task1", "task2"]
+    assert all("✅" in r.name for r in result[:2])
+    assert result[2].type == "text"
+    assert "missing: not found" in result[2].text
+    assert "malformed: 'Task'" in result[2].text
+
+async def test_uncomplete_tasks(mock_env_vars, monkeypatch):
+    """Test uncomplete_tasks clears the checkbox on every task."""
+    updates = []
+    async def fake_update_page(task_id, properties, ctx=None):
+        updates.append((task_id, properties))
+        return _task(task_id, f"Task {task_id}", "today", False)
     
-    with patch("notion_mcp.server.update_page", return_value=mock_task):
-        result = await set_task_time("task_id", "later")
-        
-        assert len(result) == 1
-        assert result[0].id == "task_id"
-        assert "Test task" in result[0].name
-        assert "⚪" in result[0].name
-        assert "later" in result[0].description
-
-@pytest.mark.asyncio
-async def test_streamable_http_server():
+    monkeypatch.setattr("notion_mcp.server.update_page", fake_update_page)
+    result = await uncomplete_tasks(["task1", "task2"])
+    
+    assert updates == [(task_id, {"Checkbox": {"checkbox": False}}) for task_id in ("task1", "task2")]
+    assert all("⬜" in r.name for r in result)
+
+@pytest.mark.parametrize("when,expected", [("Today", "today"), ("later", "later"), ("someday", "later")])
+async def test_set_task_times(mock_env_vars, monkeypatch, when, expected):
+    """Test set_task_times normalises 'when' and updates every task."""
+    updates = []
+    async def fake_update_page(task_id, properties, ctx=None):
+        updates.append((task_id, properties))
+        return _task(task_id, f"Task {task_id}", properties["When"]["select"]["name"], False)
+    
+    monkeypatch.setattr("notion_mcp.server.update_page", fake_update_page)
+    result = await set_task_times(["task1", "task2"], when)
+    
+    assert updates == [(task_id, {"When": {"select": {"name": expected}}}) for task_id in ("task1", "task2")]
+    assert [r.description for r in result] == [f"When: {expected}, Completed: False"] * 2
+
+async def test_batch_updates_bounded(mock_env_vars, monkeypatch):
+    """Test batch tools send at most BATCH_CONCURRENCY updates at a time."""
+    active = []
+    peak = 0
+    async def fake_update_page(task_id, properties, ctx=None):
+        nonlocal peak
+        active.append(task_id)
+        peak = max(peak, len(active))
+        await asyncio.sleep(0)
+        active.remove(task_id)
+        return _task(task_id, f"Task {task_id}", "today", True)
+    
+    monkeypatch.setattr("notion_mcp.server.update_page", fake_update_page)
+    task_ids = [f"task{i}" for i in range(10)]
+    result = await complete_tasks(task_ids)
+    
+    assert [r.id for r in result] == task_ids
+    assert peak == notion_server.BATCH_CONCURRENCY
+
+async def test_tools_unstructured_output():
+    """Test tools are registered without an output schema."""
+    tools = await mcp.list_tools()
+    
+    assert {tool.name for tool in tools} >= {"list_tasks", "add_task", "complete_tasks"}
+    assert all(tool.outputSchema is None for tool in tools)
+
+async def test_list_tools_cached():
+    """Test the tools/list response is built once and rebuilt after changes."""
+    tools = await mcp.list_tools()
+    assert await mcp.list_tools() is tools
+    
+    mcp.add_tool(lambda: "pong", name="ping")
+    try:
+        assert "ping" in {tool.name for tool in await mcp.list_tools()}
+    finally:
+        mcp.remove_tool("ping")
+    assert "ping" not in {tool.name for tool in await mcp.list_tools()}
+
+async def test_setup_server_env_file(monkeypatch, tmp_path):
+    """Test setup_server reads the tool lists from the env file and registers only enabled tools."""
+    env_file = tmp_path / ".env"
+    env_file.write_text("ENABLED_TOOLS=list_tasks,add_task\nDISABLED_TOOLS=add_task\n")
+    server = notion_server.NotionMCP("test")
+    for var in ("ENABLED_TOOLS", "DISABLED_TOOLS"):
+        monkeypatch.delenv(var)
+        monkeypatch.setattr(f"notion_mcp.server.{var}", getattr(notion_server, var))
+    monkeypatch.setattr("notion_mcp.server.mcp", server)
+    monkeypatch.setattr("notion_mcp.server._server_ready", False)
+    notion_server.setup_server(env_file=env_file)
+    
+    assert [tool.name for tool in await server.list_tools()] == ["list_tasks"]
+
+@pytest.mark.parametrize("value,level", [("debug", logging.DEBUG), ("VERBOSE", logging.WARNING)])
+def test_configure_logging(monkeypatch, caplog, value, level):
+    """Test LOG_LEVEL is applied, and unknown levels fall back to WARNING."""
+    levels = []
+    monkeypatch.setenv("LOG_LEVEL", value)
+    monkeypatch.setattr(logging, "basicConfig", lambda level: levels.append(level))
+    notion_server._configure_logging()
+    
+    assert levels == [level]
+    assert ("Unknown LOG_LEVEL" in caplog.text) == (value == "VERBOSE")
+
+def test_is_enabled(monkeypatch):
+    """Test tool selection via ENABLED_TOOLS and DISABLED_TOOLS."""
+    assert _is_enabled("list_tasks")
+    
+    monkeypatch.setattr("notion_mcp.server.ENABLED_TOOLS", {"list_tasks", "add_task"})
+    monkeypatch.setattr("notion_mcp.server.DISABLED_TOOLS", {"add_task"})
+    assert _is_enabled("list_tasks")
+    assert not _is_enabled("add_task")
+    assert not _is_enabled("complete_task")
+
+async def test_streamable_http_server(mock_env_vars, monkeypatch):
     """Test creating streamable_http_server."""
-    # Mock the run_streamable_http_async method
-    with patch.object(mcp, "run_streamable_http_async", AsyncMock()) as mock_run:
-        from notion_mcp.server import main
-        
-        # Mock argparse to return specific arguments
-        with patch("argparse.ArgumentParser.parse_args") as mock_args:
-            mock_args.return_value.host = "127.0.0.1"
-            mock_args.return_value.port = 8000
-            mock_args.return_value.transport = "streamable_http"
-            
-            # Call the main function
-            await main()
-            
-            # Verify that run_streamable_http_async was called with the correct arguments
-            mock_run.assert_called_once_with(host="127.0.0.1", port=8000) 
\ No newline at end of file
+    # Record server starts instead of running the HTTP server
+    runs = []
+    async def fake_run():
+        runs.append(mcp.settings.port)
+    
+    monkeypatch.setattr(mcp, "run_streamable_http_async", fake_run)
+    # Restore the shared server settings after the test
+    for name in ("host", "port", "transport_security"):
+        monkeypatch.setattr(mcp.settings, name, getattr(mcp.settings, name))
+    await main(["--host", "0.0.0.0", "--port", "8123", "--transport", "streamable-http"])
+    
+    # Verify that the server was configured before it started
+    assert runs == [8123]
+    assert mcp.settings.host == "0.0.0.0"
+
+@pytest.mark.parametrize("host,status", [("127.0.0.1", 421), ("0.0.0.0", 200)])
+async def test_streamable_http_host_header(mock_env_vars, mock_httpx_client, monkeypatch, host, status):
+    """Test requests with a public Host header are accepted only when bound to a public address."""
+    monkeypatch.setattr(mcp, "run_streamable_http_async", _async_return(None))
+    monkeypatch.setattr(mcp, "_session_manager", None)
+    for name in ("host", "port", "transport_security"):
+        monkeypatch.setattr(mcp.settings, name, getattr(mcp.settings, name))
+    await main(["--host", host, "--transport", "streamable-http"])
+    
+    # Keep the request lifespan on the fake client
+    monkeypatch.setattr("notion_mcp.server._notion_context", NotionContext(client=mock_httpx_client))
+    app = mcp.streamable_http_app()
+    async with mcp.session_manager.run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://mcp.example.com") as client:
+            response = await client.post(
+                "/mcp",
+                headers={"Accept": "application/json, text/event-stream"},
+                json={"jsonrpc": "2.0", "id": 1, "method": "tools/list"},
+            )
+    
+    assert response.status_code == status
+
+async def test_main_closes_client(mock_env_vars, monkeypatch):
+    """Test main closes the shared Notion client when the server stops."""
+    closed = []
+    async def aclose():
+        closed.append(True)
+    
+    context = NotionContext(client=SimpleNamespace(aclose=aclose))
+    monkeypatch.setattr("notion_mcp.server._notion_context", context)
+    monkeypatch.setattr(mcp, "run_stdio_async", _async_return(None))
+    await main(["--transport", "stdio"])
+    
+    assert closed == [True]
+    assert notion_server._notion_context is None
+
+def test_run_server(monkeypatch):
+    """Test run_server runs main with the given arguments on a fresh event loop."""
+    runs = []
+    async def fake_main(argv=None):
+        runs.append(argv)
+    
+    monkeypatch.setattr("notion_mcp.server.main", fake_main)
+    notion_server.run_server(["--transport", "stdio"])
+    
+    assert runs == [["--transport", "stdio"]]